@@ -0,0 +1,71 @@
+"""
+Benchmark of the import of the DAG file, the scheduler pays it every time it parses the DAG folder. The file is
+imported with python -X importtime in a new process after airflow, so only the time of main.py and of the modules
+it adds is counted. It fails when that time is above the budget or when one of the libraries of the tasks
+(pandas, pyarrow, psycopg2, ...) is imported, to be run in CI as a regression check.
+    python benchmarks/import_benchmark.py --budget-ms 100
+Without airflow, common.tasks is measured in place of main.py.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+current = os.path.dirname(os.path.realpath(__file__))
+dags_folder = os.path.join(os.path.dirname(current), 'dags')
+
+# modules imported by the scheduler anyway, left out of the measure
+airflow_modules = ['airflow', 'airflow.models', 'airflow.operators.python']
+# libraries the tasks need, a DAG file importing one of them is parsed seconds slower
+heavy_modules = ['numpy', 'pandas', 'pyarrow', 'psycopg2', 'sqlalchemy', 'openpyxl', 'barcode', 'PIL']
+default_budget_ms = 100
+
+
+def measure_import(module : str, preloaded : list) -> dict:
+    """
+    This Function imports a module of the dags folder with -X importtime in a new process, after the preloaded
+    modules, and returns its cumulative import time and the heavy modules it imported.
+    Args:
+        module: module to measure, like 'main'.
+        preloaded: modules imported before it.
+    """
+    code = ('import json, sys\n' + ''.join(f'import {name}\n' for name in preloaded) +
+            f'before = set(sys.modules)\nimport {module}\n'
+            'print(json.dumps(sorted(set(sys.modules) - before)))')
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=dags_folder, check=True,
+                            capture_output=True, text=True)
+    # import time: self [us] | cumulative | imported package
+    microseconds = 0
+    for line in output.stderr.splitlines():
+        fields = line.split('|')
+        if line.startswith('import time:') and len(fields) == 3 and fields[2].strip() == module:
+            microseconds = int(fields[1])
+    imported = json.loads(output.stdout.splitlines()[-1])
+    return {'module': module, 'milliseconds': microseconds / 1000, 'modules_imported': len(imported),
+            'heavy_modules': sorted({name.split('.')[0] for name in imported} & set(heavy_modules))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=default_budget_ms,
+                        help='largest import time of the DAG file, in milliseconds')
+    arguments = parser.parse_args()
+
+    if importlib.util.find_spec('airflow') is not None:
+        result = measure_import('main', airflow_modules)
+    else:
+        print('airflow is not installed, measuring common.tasks', file=sys.stderr)
+        result = measure_import('common.tasks', [])
+    result['budget_ms'] = arguments.budget_ms
+    print(json.dumps(result, indent=2))
+    if result['heavy_modules']:
+        sys.exit(f'{result["module"]} imports {", ".join(result["heavy_modules"])}')
+    if result['milliseconds'] > arguments.budget_ms:
+        sys.exit(f'{result["module"]} takes {result["milliseconds"]:.1f} ms to import, '
+                 f'the budget is {arguments.budget_ms:.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
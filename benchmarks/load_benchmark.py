@@ -0,0 +1,137 @@
+"""
+Benchmark of the database load: pandas to_sql against the bulk COPY loader of insert_to_database.
+
+Run it where the postgres server of SPORE_DB_* is reachable, e.g. inside the airflow webserver container. The
+tables are loaded into the database given with --database, created when missing, and its spore schema is dropped
+before every run. The database of the pipeline (SPORE_DB_NAME) is refused.
+    docker exec <container_id> python /opt/airflow/benchmarks/load_benchmark.py --rows 100000 --database spore_benchmark
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+current = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(os.path.dirname(current), 'dags'))
+
+from common import commons
+
+# database of the pipeline, the benchmarks never drop its schema
+pipeline_database = commons.database_config['database']
+
+
+def synthetic_tables(rows : int, seed : int = 0) -> dict:
+    """
+    This Function builds star schema dataframes with `rows` images, three images per membrane.
+    Args:
+        rows: number of images.
+        seed: seed of the random generator.
+    """
+    random = np.random.default_rng(seed)
+    membrane_count = max(rows // 3, 1)
+    membrane_names = pd.Series([f'{number:07d}-ECOLI-WATER-R1' for number in range(membrane_count)])
+    image_membranes = membrane_names[np.arange(rows) % membrane_count].reset_index(drop=True)
+    image_names = image_membranes + pd.Series([f'_{number // membrane_count + 1:02d}_O1' for number in range(rows)])
+    dates = pd.to_datetime('2023-01-01') + pd.to_timedelta(random.integers(0, 365, rows), unit='D')
+    optical_setups = pd.Series(['O0', 'O1', 'O2'])
+
+    membrane_dimension = pd.DataFrame({
+        'membrane_name': membrane_names, 'barcode': membrane_names, 'row_num': np.arange(membrane_count),
+        'biosample_position': np.arange(membrane_count, dtype=float), 'matrix_tested_inprogress': 'water',
+        'experiment_name': 'testing xxx against yyy', 'usable_for_ml': True, 'exclusion_reason': None,
+    })
+    images_dimension = pd.DataFrame({
+        'image_name': image_names, 'barcode': image_names, 'matrix_tested_inprogress': 'water',
+        'experiment_name': 'testing xxx against yyy', 'usable_for_ml': random.random(rows) > 0.2,
+        'exclusion_reason': None,
+    })
+    camera_dimension = pd.DataFrame({'optical_setup': optical_setups, 'lens_diameter': [53, 77, 77],
+                                     'objective': ['x20', 'x20', 'x40'], 'camera': 'camera1'})
+    unique_dates = pd.Series(dates.unique())
+    date_dimension = pd.DataFrame({'date_id': commons.date_ids(unique_dates), 'filtration_date': unique_dates, 'date_day': unique_dates.dt.day,
+                                   'date_month': unique_dates.dt.month, 'date_year': unique_dates.dt.year})
+    membrane_images_camera = pd.DataFrame({
+        'image_name': image_names, 'number_of_bacteria_pixels': random.integers(0, 10000, rows).astype(float),
+        'optical_setup': optical_setups[np.arange(rows) % 3].values, 'acquisitions_realized': 1.0,
+        'filtration_date': dates, 'types_of_microorganisms': 'ECOLI', 'matrix_dilution': 'D00',
+        'total_number_of_bacteria_measured_in_lab': random.random(rows) * 5, 'pseudomonas_percentage': 0.0,
+        'nomenclature_format': 1, 'ecoli_percentage': 100.0, 'number_of_acquisitions': 1.0,
+        'pretreatment_operator': 'MP', 'membrane': image_membranes,
+    })
+    return {'membrane_dimension': membrane_dimension, 'images_dimension': images_dimension,
+            'camera_dimension': camera_dimension, 'membrane_images_camera': membrane_images_camera,
+            'date_dimension': date_dimension}
+
+
+def use_benchmark_database(database : str) -> None:
+    """
+    This Function points commons to a database of the same server made for the benchmarks, created when
+    missing, so they never load into the tables of the pipeline. It has to run before the first connection.
+    Args:
+        database: name of the benchmark database.
+    """
+    if database == pipeline_database:
+        sys.exit(f'{database} is the database of the pipeline (SPORE_DB_NAME), give the benchmarks their own')
+    connection = psycopg2.connect(**dict(commons.database_config, database='postgres'))
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_database WHERE datname = %s', (database,))
+        if cursor.fetchone() is None:
+            cursor.execute(f'CREATE DATABASE "{database}"')
+    connection.close()
+    commons.database_config['database'] = database
+
+
+def drop_schema() -> None:
+    """
+    This Function drops the spore schema of the benchmark database so every run loads into empty tables.
+    """
+    if commons.database_config['database'] == pipeline_database:
+        raise RuntimeError('the spore schema of the pipeline database is never dropped, see use_benchmark_database')
+    with commons.get_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute('DROP SCHEMA IF EXISTS spore CASCADE')
+        connection.commit()
+
+
+def time_load(tables : dict, load_method : str, load_workers : int) -> float:
+    """
+    This Function loads the tables into an empty schema and returns the wall time in seconds.
+    Args:
+        tables: dataframes returned by synthetic_tables.
+        load_method: 'copy' or 'to_sql'.
+        load_workers: number of dimension tables loaded at the same time.
+    """
+    drop_schema()
+    start = time.perf_counter()
+    commons.insert_to_database(**tables, load_method=load_method, load_workers=load_workers)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='number of images in the fact table')
+    parser.add_argument('--workers', type=int, default=commons.default_load_workers,
+                        help='dimension tables loaded at the same time by the copy loader')
+    parser.add_argument('--database', required=True,
+                        help='database the tables are loaded into, its spore schema is dropped before every run')
+    arguments = parser.parse_args()
+
+    use_benchmark_database(arguments.database)
+
+    tables = synthetic_tables(arguments.rows)
+    results = {
+        'to_sql': time_load(tables, 'to_sql', 1),
+        'copy': time_load(tables, 'copy', 1),
+        'copy_parallel': time_load(tables, 'copy', arguments.workers),
+    }
+    for load_method, seconds in results.items():
+        print(f'{load_method:<14} {seconds:8.2f}s  {results["to_sql"] / seconds:6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
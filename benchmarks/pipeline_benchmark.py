@@ -0,0 +1,167 @@
+"""
+Benchmark of every stage of the ingestion pipeline on synthetic workbooks: reading, staging, the validation,
+the transform, the membrane matching, the database load and the barcodes. Results are written as json, one entry
+per size, to track regressions between commits.
+
+Workbooks up to the excel row limit are written as excel files, bigger ones as staged parquet sheets, the read
+and staging stages of those are skipped. The load stage loads into the database given with --database, on the
+server of SPORE_DB_*, and drops its spore schema first, use --transform-only to run without a database.
+    python benchmarks/pipeline_benchmark.py --sizes 1000 100000 1000000 --database spore_benchmark --output results.json
+    python benchmarks/pipeline_benchmark.py --sizes 10000000 --transform-only
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+
+current = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(os.path.dirname(current), 'dags'))
+
+from common import commons
+from load_benchmark import drop_schema, use_benchmark_database
+from synthetic_data import excel_row_limit, synthetic_sheets, write_staged_workbook, write_workbook
+
+default_sizes = [1000, 10000, 100000]
+
+
+@contextmanager
+def timed(stages : dict, stage : str):
+    """
+    This Function records the wall time of the block in stages, in seconds.
+    Args:
+        stages: timings of the run.
+        stage: name of the stage.
+    """
+    start = time.perf_counter()
+    yield
+    stages[stage] = round(time.perf_counter() - start, 4)
+
+
+def run_pipeline(images : int, work_folder : str, transform_only : bool, barcodes : int) -> dict:
+    """
+    This Function builds a synthetic workbook of `images` images and times every stage of the pipeline on it.
+    Args:
+        images: number of rows of the Images sheet.
+        work_folder: folder of the workbook, the staged files and the barcodes.
+        transform_only: skip the stages needing a database.
+        barcodes: number of image barcodes rendered, 0 skips the stage.
+    """
+    stages = {}
+    with timed(stages, 'generate'):
+        membrane_sheet, images_sheet = synthetic_sheets(images)
+    workbook_format = 'xlsx' if images <= excel_row_limit else 'parquet'
+
+    if workbook_format == 'xlsx':
+        data_path = os.path.join(work_folder, f'input_{images}.xlsx')
+        with timed(stages, 'write_workbook'):
+            write_workbook(membrane_sheet, images_sheet, data_path)
+        del membrane_sheet, images_sheet
+        with timed(stages, 'read_excel'):
+            commons.read_file(data_path)
+        staging_folder = os.path.join(work_folder, 'staging')
+        with timed(stages, 'stage_workbook'):
+            staged_folder = commons.stage_workbook(data_path, staging_folder)
+    else:
+        with timed(stages, 'write_workbook'):
+            staged_folder = write_staged_workbook(membrane_sheet, images_sheet,
+                                                  os.path.join(work_folder, f'staged_{images}'))
+        del membrane_sheet, images_sheet
+    with timed(stages, 'read_staged'):
+        membrane_data, images_data = commons.read_staged_workbook(staged_folder)
+
+    with timed(stages, 'validate'):
+        membrane_data, images_data, _ = commons.validate_sheets(membrane_data, images_data)
+    with timed(stages, 'prepare'):
+        membrane_data = commons.prepare_membrane_data(membrane_data)
+        images_data = commons.prepare_images_data(images_data)
+    with timed(stages, 'schema_setup'):
+        membrane_data, images_data, membrane_images_camera, camera_dimension, date_dimension = \
+            commons.schema_setup(membrane_data, images_data)
+    with timed(stages, 'build_membrane_automaton'):
+        automaton = commons.build_membrane_automaton(membrane_data['membrane_name'])
+    with timed(stages, 'membrane_matching'):
+        commons.generate_membrane_column_from_image_name(None, membrane_images_camera[['image_name']].copy(),
+                                                         automaton=automaton)
+    with timed(stages, 'complete_fact_table'):
+        membrane_images_camera = commons.complete_fact_table(membrane_images_camera, automaton=automaton)
+    tables = {'membrane_dimension': membrane_data, 'images_dimension': images_data,
+              'camera_dimension': camera_dimension, 'date_dimension': date_dimension,
+              'membrane_image_camera': membrane_images_camera}
+
+    if not transform_only:
+        drop_schema()
+        with timed(stages, 'insert_to_database'):
+            commons.insert_to_database(membrane_data, images_data, camera_dimension, membrane_images_camera,
+                                       date_dimension)
+    if barcodes:
+        if transform_only:
+            codes = images_data['image_name'].head(barcodes).tolist()
+        else:
+            codes = list(itertools.islice(commons.fetch_data_from_database('images_dimension', 'image_name'), barcodes))
+        os.makedirs(os.path.join(work_folder, 'images_barcodes'))
+        with timed(stages, 'generate_and_save_barcode'):
+            commons.generate_and_save_barcode(codes, 'images_barcodes', results_folder=work_folder)
+
+    return {'images': images, 'membranes': len(membrane_data), 'format': workbook_format,
+            'barcodes': barcodes, 'stages': stages, 'rows': {name: len(table) for name, table in tables.items()}}
+
+
+def git_commit() -> str:
+    """
+    This Function returns the commit of the benchmarked code, None outside of a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=current, check=True, capture_output=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes, help='numbers of images')
+    parser.add_argument('--transform-only', action='store_true', help='skip the stages needing a database')
+    parser.add_argument('--barcodes', type=int, default=1000, help='number of barcodes rendered, 0 to skip')
+    parser.add_argument('--database', help='database of the load stage, its spore schema is dropped first')
+    parser.add_argument('--output', help='json file of the results, printed when not given')
+    arguments = parser.parse_args()
+    if not arguments.transform_only:
+        if arguments.database is None:
+            parser.error('--database is required, or --transform-only to run without a database')
+        use_benchmark_database(arguments.database)
+
+    results = {
+        'benchmark': 'pipeline',
+        'started': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'cpu_count': os.cpu_count(),
+        'runs': [],
+    }
+    for images in arguments.sizes:
+        with tempfile.TemporaryDirectory() as work_folder:
+            run = run_pipeline(images, work_folder, arguments.transform_only, arguments.barcodes)
+        results['runs'].append(run)
+        print(f'{images:>10} images  ' + '  '.join(f'{stage} {seconds:.2f}s' for stage, seconds in run['stages'].items()),
+              file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Synthetic Membranes and Images sheets shaped like data/input.xlsx, for the benchmarks.
+
+Membrane names follow the nomenclature of the real file (00001-ECOLI-WATER-R1), a share of the membranes are
+repeats whose name extends another membrane name (00001-ECOLI-WATER-R1-B), so the membrane matching has to pick
+the longest name. Every image is named after its membrane, its index and its optical setup (_01_O1).
+"""
+import os
+import sys
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+current = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(os.path.dirname(current), 'dags'))
+
+from common import commons
+
+# largest number of data rows of an excel sheet, bigger workbooks are written as staged parquet sheets
+excel_row_limit = 1048575
+
+organisms = ['ECOLI', 'PSEUDOMONAS', 'MIX1', 'NONE']
+matrices = ['WATER', 'CHOCOLATE', 'ENV']
+# optical_setup, lens_diameter, objective, camera
+camera_setups = [('O0', 53, 'x20', 'camera1'), ('O1', 77, 'x20', 'camera1'), ('O2', 77, 'x40', 'camera2')]
+exclusion_reasons = ['no bacteria', 'bad image', 'too much noise', 'too much noise on image']
+
+membrane_columns = ['membrane name', 'barcode', 'row', 'nomenclature_format_(from0tohigher)',
+                    'biosample_position_(0to999999)', 'matrix_tested_inprogress', 'experiment_name_(aaaa#what_it?)',
+                    'Usable for ML', 'Exclusion reason', 'total number of bacteria measured in lab (log10)',
+                    'acquisitions_realized?', 'number_of_acquisitions', 'filtration_date_yymmdd',
+                    'matrix_dilution_(dxx)', 'types_of_microorganisms_(AAAA-Bxx)', 'ecoli %', 'pseudomonas %',
+                    'pretreatment_operator']
+
+images_columns = ['image name', 'barcode', 'nomenclature_format_(from0tohigher)', 'matrix_tested_inprogress',
+                  'experiment_name_(aaaa#what_it?)', 'Usable for ML', 'Exclusion reason',
+                  'total number of bacteria measured in lab (log10)', 'number of bacteria pixels',
+                  'acquisitions_realized?', 'number_of_acquisitions', 'filtration_date_yymmdd',
+                  'matrix_dilution_(dxx)', 'types_of_microorganisms_(AAAA-Bxx)', 'ecoli %', 'pseudomonas %',
+                  'pretreatment_operator', 'optical setup', 'lens diameter', 'objective', 'camera']
+
+
+def synthetic_sheets(images : int, images_per_membrane : int = 3, nested_share : float = 0.05, days : int = 365,
+                     seed : int = 0) -> tuple:
+    """
+    This Function builds raw Membranes and Images sheets, with the column names and value types of the excel file.
+    Args:
+        images: number of rows of the Images sheet.
+        images_per_membrane: images taken of every membrane.
+        nested_share: share of the membranes whose name extends the name of another membrane, at most 0.5.
+        days: filtration dates are spread over this many days from 2023-08-01.
+        seed: seed of the random generator.
+
+    Returns:
+        membrane sheet and images sheet.
+    """
+    random = np.random.default_rng(seed)
+    membrane_count = max(images // images_per_membrane, 1)
+    base_count = max(int(membrane_count * (1 - nested_share)), 1)
+    width = max(5, len(str(base_count)))
+
+    numbers = np.arange(base_count)
+    organism = random.integers(0, len(organisms), base_count)
+    matrix = random.integers(0, len(matrices), base_count)
+    repeat = random.integers(1, 4, base_count)
+    base_names = pd.Series([f'{number + 1:0{width}d}-{organisms[o]}-{matrices[m]}-R{r}'
+                            for number, o, m, r in zip(numbers, organism, matrix, repeat)], dtype=object)
+    nested_parents = random.choice(base_count, membrane_count - base_count, replace=False)
+    membrane_names = pd.concat([base_names, base_names[nested_parents] + '-B'], ignore_index=True)
+    membrane_organism = np.concatenate([organism, organism[nested_parents]])
+    membrane_matrix = np.concatenate([matrix, matrix[nested_parents]])
+    dates = pd.Timestamp('2023-08-01') + pd.to_timedelta(random.integers(0, days, membrane_count), unit='D')
+    membrane_dates = dates.strftime('%y%m%d').astype(float).to_numpy()
+
+    image_membrane = np.arange(images) % membrane_count
+    image_index = np.arange(images) // membrane_count + 1
+    setup = random.integers(0, len(camera_setups), membrane_count)[image_membrane]
+    setup_names = np.array([camera_setup[0] for camera_setup in camera_setups], dtype=object)[setup]
+    image_names = (membrane_names.to_numpy()[image_membrane]
+                   + pd.Series(image_index).map('_{:02d}_'.format).to_numpy() + setup_names)
+    usable = np.where(random.random(images) < 0.9, True, 'FAUX').astype(object)
+    usable[usable == 'True'] = True
+    excluded = random.random(images) < 0.1
+    image_dates = membrane_dates[image_membrane]
+    image_dates[random.random(images) < 0.01] = np.nan
+
+    def organism_share(name, values):
+        return np.where(np.array(organisms)[values] == name, 1.0, 0.0)
+
+    membrane_sheet = pd.DataFrame({
+        'membrane name': membrane_names, 'barcode': np.nan, 'row': np.arange(membrane_count) + 1,
+        'nomenclature_format_(from0tohigher)': 1, 'biosample_position_(0to999999)': np.nan,
+        'matrix_tested_inprogress': np.array(matrices, dtype=object)[membrane_matrix],
+        'experiment_name_(aaaa#what_it?)': 'testing xxx against yyy', 'Usable for ML': True,
+        'Exclusion reason': np.nan,
+        'total number of bacteria measured in lab (log10)': np.round(random.random(membrane_count) * 6, 2),
+        'acquisitions_realized?': 1.0, 'number_of_acquisitions': float(images_per_membrane),
+        'filtration_date_yymmdd': membrane_dates, 'matrix_dilution_(dxx)': 'D00',
+        'types_of_microorganisms_(AAAA-Bxx)': np.array(organisms, dtype=object)[membrane_organism],
+        'ecoli %': organism_share('ECOLI', membrane_organism),
+        'pseudomonas %': organism_share('PSEUDOMONAS', membrane_organism), 'pretreatment_operator': 'MP',
+    }, columns=membrane_columns)
+    images_sheet = pd.DataFrame({
+        'image name': image_names, 'barcode': np.nan, 'nomenclature_format_(from0tohigher)': 1,
+        'matrix_tested_inprogress': membrane_sheet['matrix_tested_inprogress'].to_numpy()[image_membrane],
+        'experiment_name_(aaaa#what_it?)': 'testing xxx against yyy', 'Usable for ML': usable,
+        'Exclusion reason': np.where(excluded, np.array(exclusion_reasons, dtype=object)[
+            random.integers(0, len(exclusion_reasons), images)], np.nan),
+        'total number of bacteria measured in lab (log10)':
+            membrane_sheet['total number of bacteria measured in lab (log10)'].to_numpy()[image_membrane],
+        'number of bacteria pixels': random.integers(0, 100000, images).astype(float),
+        'acquisitions_realized?': 1.0, 'number_of_acquisitions': float(images_per_membrane),
+        'filtration_date_yymmdd': image_dates, 'matrix_dilution_(dxx)': 'D00',
+        'types_of_microorganisms_(AAAA-Bxx)': membrane_sheet['types_of_microorganisms_(AAAA-Bxx)'].to_numpy()[image_membrane],
+        'ecoli %': membrane_sheet['ecoli %'].to_numpy()[image_membrane],
+        'pseudomonas %': membrane_sheet['pseudomonas %'].to_numpy()[image_membrane], 'pretreatment_operator': 'MP',
+        'optical setup': setup_names,
+        'lens diameter': np.array([camera_setup[1] for camera_setup in camera_setups])[setup],
+        'objective': np.array([camera_setup[2] for camera_setup in camera_setups], dtype=object)[setup],
+        'camera': np.array([camera_setup[3] for camera_setup in camera_setups], dtype=object)[setup],
+    }, columns=images_columns)
+    return membrane_sheet, images_sheet
+
+
+def write_workbook(membrane_sheet : pd.DataFrame, images_sheet : pd.DataFrame, data_path : str) -> None:
+    """
+    This Function writes the sheets to an excel file with the write only mode of openpyxl, missing values are
+    written as empty cells.
+    Args:
+        membrane_sheet: data of the Membranes sheet.
+        images_sheet: data of the Images sheet.
+        data_path: path of the excel file.
+    """
+    if len(images_sheet) > excel_row_limit:
+        raise ValueError(f'{len(images_sheet)} images do not fit in an excel sheet, use write_staged_workbook')
+    workbook = openpyxl.Workbook(write_only=True)
+    for sheet_name, dataframe in [('Membranes', membrane_sheet), ('Images', images_sheet)]:
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append(list(dataframe.columns))
+        values = dataframe.astype(object).where(dataframe.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            worksheet.append(row)
+    workbook.save(data_path)
+
+
+def write_staged_workbook(membrane_sheet : pd.DataFrame, images_sheet : pd.DataFrame, staged_folder : str) -> str:
+    """
+    This Function writes the sheets the way stage_workbook does, to be read with read_staged_workbook. Used for
+    workbooks above the row limit of excel.
+    Args:
+        membrane_sheet: data of the Membranes sheet.
+        images_sheet: data of the Images sheet.
+        staged_folder: folder of the parquet files.
+    """
+    os.makedirs(staged_folder, exist_ok=True)
+    commons.write_staged_sheet(membrane_sheet, os.path.join(staged_folder, 'Membranes.parquet'))
+    commons.write_staged_sheet(images_sheet, os.path.join(staged_folder, 'Images.parquet'))
+    return staged_folder
@@ -0,0 +1,144 @@
+"""
+Benchmark of the transform: peak memory and runtime of prepare_*_data, schema_setup and the date conversion of
+the fact table, against the transform as it was before it shared columns between tables (legacy below).
+Membrane matching and row keys are the same in both and left out.
+
+Every implementation runs in its own process on a synthetic Images sheet, peak memory is the highest resident
+set size sampled during the transform, above the size of the process once the sheet is built. Linux with glibc
+only.
+    python benchmarks/transform_benchmark.py --rows 1000000
+"""
+import argparse
+import ctypes
+import gc
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pandas as pd
+
+current = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(os.path.dirname(current), 'dags'))
+
+from common import commons
+from synthetic_data import synthetic_sheets
+
+implementations = ['legacy', 'current']
+
+
+def legacy_transform(membrane_data : pd.DataFrame, images_data : pd.DataFrame) -> tuple:
+    """
+    This Function is the transform before it was made copy free: in place renames that extend the column dicts,
+    copied column selections and the filtration date parsed for the fact and the date table.
+    Args:
+        membrane_data: raw data of membrane sheet.
+        images_data: raw data of images sheet.
+    """
+    membrane_column_name = dict(commons.membrane_column_name)
+    images_column_name = dict(commons.images_column_name)
+    for dataframe, specific_column_name in [(membrane_data, membrane_column_name), (images_data, images_column_name)]:
+        dataframe.rename(columns=commons.common_column_name, inplace=True)
+        specific_column_name.update(commons.common_column_name)
+        dataframe.rename(columns=specific_column_name, inplace=True)
+    membrane_data['barcode'] = membrane_data['barcode'].fillna(membrane_data['membrane_name'])
+    images_data['usable_for_ml'] = images_data['usable_for_ml'].replace('FAUX', False)
+    images_data['barcode'] = images_data['barcode'].fillna(images_data['image_name'])
+
+    membrane_images_camera = images_data[commons.images_data_to_membrane_images_camera].copy()
+    camera_dimension = images_data[commons.images_data_to_camera].copy().drop_duplicates()
+    images_data.drop(columns=commons.columns_to_drop_images, inplace=True)
+    date_table = pd.DataFrame()
+    date_table['filtration_date'] = pd.to_datetime(membrane_images_camera['filtration_date'], format='%y%m%d')
+    date_table['date_day'] = date_table['filtration_date'].dt.day
+    date_table['date_month'] = date_table['filtration_date'].dt.month
+    date_table['date_year'] = date_table['filtration_date'].dt.year
+    date_dimension = date_table.drop_duplicates().dropna()
+    membrane_data.drop(columns=commons.columns_to_drop_membrane, inplace=True)
+
+    membrane_images_camera = commons.convert_int_to_percent(membrane_images_camera, commons.columns_to_remove_symbol)
+    membrane_images_camera = membrane_images_camera.assign(
+        filtration_date=pd.to_datetime(membrane_images_camera['filtration_date'], format='%y%m%d'))
+    return membrane_data, images_data, membrane_images_camera, camera_dimension, date_dimension
+
+
+def current_transform(membrane_data : pd.DataFrame, images_data : pd.DataFrame) -> tuple:
+    """
+    This Function is the transform of data_transofmation, up to the membrane matching.
+    Args:
+        membrane_data: raw data of membrane sheet.
+        images_data: raw data of images sheet.
+    """
+    membrane_data = commons.prepare_membrane_data(membrane_data)
+    images_data = commons.prepare_images_data(images_data)
+    membrane_data, images_data, membrane_images_camera, camera_dimension, date_dimension = \
+        commons.schema_setup(membrane_data, images_data)
+    membrane_images_camera = commons.convert_int_to_percent(membrane_images_camera, commons.columns_to_remove_symbol)
+    membrane_images_camera = commons.convert_to_date(membrane_images_camera, column='filtration_date')
+    return membrane_data, images_data, membrane_images_camera, camera_dimension, date_dimension
+
+
+def resident_memory() -> int:
+    """
+    This Function returns the resident set size of the process in bytes.
+    """
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def measure(implementation : str, rows : int) -> dict:
+    """
+    This Function runs one implementation on a synthetic sheet and returns its runtime and peak memory.
+    Args:
+        implementation: 'legacy' or 'current'.
+        rows: number of images.
+    """
+    transform = legacy_transform if implementation == 'legacy' else current_transform
+    membrane_sheet, images_sheet = synthetic_sheets(rows)
+    # hand the memory freed while building the sheets back to the system, or the transform reuses it unseen
+    gc.collect()
+    ctypes.CDLL('libc.so.6').malloc_trim(0)
+    baseline = resident_memory()
+    peak = [baseline]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(0.002):
+            peak[0] = max(peak[0], resident_memory())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    tables = transform(membrane_sheet, images_sheet)
+    seconds = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+    peak[0] = max(peak[0], resident_memory())
+    return {'implementation': implementation, 'rows': rows, 'seconds': seconds,
+            'peak_memory_mb': (peak[0] - baseline) / 2 ** 20, 'fact_rows': len(tables[2])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='number of rows of the Images sheet')
+    parser.add_argument('--implementation', choices=implementations, help='run one implementation and print json')
+    arguments = parser.parse_args()
+
+    if arguments.implementation:
+        print(json.dumps(measure(arguments.implementation, arguments.rows)))
+        return
+    results = {}
+    for implementation in implementations:
+        output = subprocess.run([sys.executable, __file__, '--rows', str(arguments.rows),
+                                 '--implementation', implementation], check=True, capture_output=True, text=True)
+        results[implementation] = json.loads(output.stdout.splitlines()[-1])
+    for implementation, result in results.items():
+        print(f'{implementation:<8} {result["seconds"]:8.2f}s {result["peak_memory_mb"]:9.1f} MB  '
+              f'{results["legacy"]["seconds"] / result["seconds"]:5.1f}x time  '
+              f'{results["legacy"]["peak_memory_mb"] / max(result["peak_memory_mb"], 1):5.1f}x memory')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,12 @@
-
-
 CREATE SCHEMA IF NOT EXISTS spore;
 
 CREATE TABLE IF NOT EXISTS spore.membrane_dimension (
-    membrane_name TEXT PRIMARY KEY, 
-    barcode TEXT, 
+    membrane_name TEXT PRIMARY KEY,
+    barcode TEXT,
     row_num INT,
     biosample_position DECIMAL,
-    matrix_tested_inprogress VARCHAR, 
-    experiment_name TEXT, 
+    matrix_tested_inprogress VARCHAR,
+    experiment_name TEXT,
     usable_for_ml BOOLEAN,
     exclusion_reason VARCHAR
 );
@@ -21,16 +19,147 @@ CREATE TABLE IF NOT EXISTS spore.images_dimension (
 );
 
 
-CREATE TABLE IF NOT EXISTS spore.camera_dimension(optical_setup TEXT PRIMARY KEY, lens_diameter DECIMAL, objective VARCHAR, camera VARCHAR );
+-- camera_id and date_id are the keys used by the fact table, optical_setup and filtration_date stay unique
+CREATE TABLE IF NOT EXISTS spore.camera_dimension(
+    camera_id SERIAL PRIMARY KEY, optical_setup TEXT NOT NULL UNIQUE, lens_diameter DECIMAL, objective VARCHAR,
+    camera VARCHAR
+);
 
-CREATE TABLE IF NOT EXISTS spore.date_dimension(filtration_date DATE PRIMARY KEY, Date_day int, date_month int, date_year int);
+-- date_id is the date as yyyymmdd, 0 stands for an unknown date
+CREATE TABLE IF NOT EXISTS spore.date_dimension(
+    date_id INT PRIMARY KEY, filtration_date DATE UNIQUE, Date_day int, date_month int, date_year int
+);
+
+-- databases created before the surrogate keys: the fact table is moved aside and the dimensions get their keys
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_schema = 'spore' AND table_name = 'camera_dimension' AND column_name = 'camera_id') THEN
+        IF to_regclass('spore.membrane_image_camera') IS NOT NULL THEN
+            ALTER TABLE spore.membrane_image_camera RENAME TO membrane_image_camera_unpartitioned;
+            ALTER TABLE spore.membrane_image_camera_unpartitioned ADD COLUMN IF NOT EXISTS row_key BIGINT;
+            -- frees the index name for the partitioned table
+            DROP INDEX IF EXISTS spore.membrane_image_camera_row_key;
+        END IF;
+        ALTER TABLE spore.camera_dimension DROP CONSTRAINT camera_dimension_pkey CASCADE;
+        ALTER TABLE spore.camera_dimension ADD COLUMN camera_id SERIAL PRIMARY KEY;
+        ALTER TABLE spore.camera_dimension ADD CONSTRAINT camera_dimension_optical_setup_key UNIQUE (optical_setup);
+        ALTER TABLE spore.date_dimension DROP CONSTRAINT date_dimension_pkey CASCADE;
+        ALTER TABLE spore.date_dimension ALTER COLUMN filtration_date DROP NOT NULL;
+        ALTER TABLE spore.date_dimension ADD COLUMN date_id INT;
+        UPDATE spore.date_dimension SET date_id = to_char(filtration_date, 'YYYYMMDD')::int;
+        ALTER TABLE spore.date_dimension ADD PRIMARY KEY (date_id);
+        ALTER TABLE spore.date_dimension ADD CONSTRAINT date_dimension_filtration_date_key UNIQUE (filtration_date);
+    END IF;
+END $$;
+
+INSERT INTO spore.date_dimension (date_id) VALUES (0) ON CONFLICT DO NOTHING;
+
+-- range partitioned by month of date_id, see spore.create_fact_partitions
 CREATE TABLE IF NOT EXISTS spore.membrane_image_camera (
     membrane VARCHAR, FOREIGN KEY (membrane) REFERENCES spore.membrane_dimension(membrane_name),
     image_name VARCHAR, FOREIGN KEY (image_name) REFERENCES spore.images_dimension(image_name),
-    optical_setup VARCHAR ,FOREIGN KEY (optical_setup) REFERENCES spore.camera_dimension(optical_setup),
+    camera_id INT, FOREIGN KEY (camera_id) REFERENCES spore.camera_dimension(camera_id),
     nomenclature_format DECIMAL, number_of_bacteria_pixels BIGINT,
-    acquisitions_realized INT, number_of_acquisitions INT, filtration_date DATE,
-    FOREIGN KEY (filtration_date) REFERENCES spore.date_dimension(filtration_date),
+    acquisitions_realized INT, number_of_acquisitions INT,
+    date_id INT NOT NULL, FOREIGN KEY (date_id) REFERENCES spore.date_dimension(date_id),
     matrix_dilution VARCHAR, types_of_microorganisms VARCHAR, ecoli_percentage DECIMAL(5,2),
-    pseudomonas_percentage DECIMAL(5,2), pretreatment_operator VARCHAR, total_number_of_bacteria_measured_in_lab DECIMAL
-);
\ No newline at end of file
+    pseudomonas_percentage DECIMAL(5,2), pretreatment_operator VARCHAR, total_number_of_bacteria_measured_in_lab DECIMAL,
+    row_key BIGINT
+) PARTITION BY RANGE (date_id);
+CREATE TABLE IF NOT EXISTS spore.membrane_image_camera_unknown_date PARTITION OF spore.membrane_image_camera
+    FOR VALUES FROM (0) TO (1);
+-- no default partition: every month gets its own before its rows are loaded, and attaching a month would lock
+-- a default partition for the whole load, see bulk_copy_to_table
+DO $$
+BEGIN
+    IF to_regclass('spore.membrane_image_camera_default') IS NOT NULL THEN
+        IF NOT EXISTS (SELECT 1 FROM spore.membrane_image_camera_default) THEN
+            DROP TABLE spore.membrane_image_camera_default;
+        END IF;
+    END IF;
+END $$;
+
+-- a unique index of a partitioned table has to hold the partition key
+CREATE UNIQUE INDEX IF NOT EXISTS membrane_image_camera_row_key ON spore.membrane_image_camera (row_key, date_id);
+-- covers the membrane statistics and the plots by membrane
+CREATE INDEX IF NOT EXISTS membrane_image_camera_membrane ON spore.membrane_image_camera (membrane)
+    INCLUDE (date_id, types_of_microorganisms, number_of_bacteria_pixels, total_number_of_bacteria_measured_in_lab);
+-- joins to the images for the ML exports, and date lookups within a partition
+CREATE INDEX IF NOT EXISTS membrane_image_camera_image_name ON spore.membrane_image_camera (image_name);
+CREATE INDEX IF NOT EXISTS membrane_image_camera_date_id ON spore.membrane_image_camera (date_id);
+CREATE INDEX IF NOT EXISTS images_dimension_usable_for_ml ON spore.images_dimension (image_name)
+    INCLUDE (barcode, experiment_name) WHERE usable_for_ml;
+
+-- creates the monthly partitions of the given date ids that do not exist yet
+CREATE OR REPLACE FUNCTION spore.create_fact_partitions(date_ids INT[]) RETURNS void AS $$
+DECLARE
+    month_start INT;
+BEGIN
+    FOR month_start IN SELECT DISTINCT date_id / 100 * 100 FROM unnest(date_ids) AS date_id WHERE date_id > 0 LOOP
+        IF to_regclass(format('spore.membrane_image_camera_%s', month_start / 100)) IS NULL THEN
+            EXECUTE format('CREATE TABLE spore.membrane_image_camera_%s PARTITION OF spore.membrane_image_camera '
+                           'FOR VALUES FROM (%s) TO (%s)', month_start / 100, month_start, month_start + 100);
+        END IF;
+    END LOOP;
+END $$ LANGUAGE plpgsql;
+
+-- rows of a database created before the partitioning are moved to the partitioned table
+DO $$
+BEGIN
+    IF to_regclass('spore.membrane_image_camera_unpartitioned') IS NOT NULL THEN
+        PERFORM spore.create_fact_partitions(ARRAY(
+            SELECT DISTINCT to_char(filtration_date, 'YYYYMMDD')::int FROM spore.membrane_image_camera_unpartitioned
+            WHERE filtration_date IS NOT NULL));
+        INSERT INTO spore.membrane_image_camera (
+            membrane, image_name, camera_id, nomenclature_format, number_of_bacteria_pixels, acquisitions_realized,
+            number_of_acquisitions, date_id, matrix_dilution, types_of_microorganisms, ecoli_percentage,
+            pseudomonas_percentage, pretreatment_operator, total_number_of_bacteria_measured_in_lab, row_key)
+        SELECT f.membrane, f.image_name, c.camera_id, f.nomenclature_format, f.number_of_bacteria_pixels,
+               f.acquisitions_realized, f.number_of_acquisitions,
+               COALESCE(to_char(f.filtration_date, 'YYYYMMDD')::int, 0), f.matrix_dilution,
+               f.types_of_microorganisms, f.ecoli_percentage, f.pseudomonas_percentage, f.pretreatment_operator,
+               f.total_number_of_bacteria_measured_in_lab, f.row_key
+        FROM spore.membrane_image_camera_unpartitioned f
+        LEFT JOIN spore.camera_dimension c ON c.optical_setup = f.optical_setup;
+        DROP TABLE spore.membrane_image_camera_unpartitioned;
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS spore.row_hashes (
+    table_name TEXT,
+    row_key BIGINT,
+    row_hash BIGINT,
+    PRIMARY KEY (table_name, row_key)
+);
+
+-- tables, or chunks, loaded by a load that has not finished yet, a retry of the load skips them
+CREATE TABLE IF NOT EXISTS spore.load_checkpoints (
+    load_id TEXT,
+    checkpoint TEXT,
+    row_count BIGINT,
+    loaded_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (load_id, checkpoint)
+);
+
+-- per membrane, date and microorganism totals of the fact table, kept up to date by every fact load
+CREATE TABLE IF NOT EXISTS spore.membrane_statistics (
+    membrane VARCHAR NOT NULL,
+    filtration_date DATE,
+    types_of_microorganisms VARCHAR,
+    image_count BIGINT,
+    number_of_bacteria_pixels NUMERIC,
+    total_number_of_bacteria_measured_in_lab NUMERIC
+);
+CREATE UNIQUE INDEX IF NOT EXISTS membrane_statistics_key ON spore.membrane_statistics
+    (membrane, COALESCE(filtration_date, '-infinity'::date), COALESCE(types_of_microorganisms, ''));
+CREATE INDEX IF NOT EXISTS membrane_statistics_filtration_date ON spore.membrane_statistics (filtration_date);
+
+-- fills the table once when it is added to a database holding facts already
+INSERT INTO spore.membrane_statistics
+SELECT f.membrane, d.filtration_date, f.types_of_microorganisms, COUNT(*),
+       COALESCE(SUM(f.number_of_bacteria_pixels), 0), COALESCE(SUM(f.total_number_of_bacteria_measured_in_lab), 0)
+FROM spore.membrane_image_camera f
+JOIN spore.date_dimension d ON d.date_id = f.date_id
+WHERE f.membrane IS NOT NULL AND NOT EXISTS (SELECT 1 FROM spore.membrane_statistics)
+GROUP BY f.membrane, d.filtration_date, f.types_of_microorganisms;
@@ -0,0 +1,36 @@
+"""
+Callables of the DAG tasks. The scheduler imports main.py, and so this module, every time it parses the DAG
+folder, it only imports the standard library: commons.py, with pandas, pyarrow, psycopg2, sqlalchemy and the
+barcode libraries, is imported by the task when it runs.
+"""
+import importlib
+import inspect
+
+
+def deferred_task(function_name : str):
+    """
+    This Function returns the callable of a DAG task running the function of commons.py of the same name, wrapped
+    with task_summary. commons.py is imported on the first run of a task of the worker process.
+    Args:
+        function_name: name of the function in commons.py.
+    """
+    def task(**kwargs):
+        commons = importlib.import_module('.commons', __package__)
+        function = getattr(commons, function_name)
+        # the PythonOperator gives the whole task context to a callable taking **kwargs, keep the arguments of function
+        parameters = inspect.signature(function).parameters
+        if not any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values()):
+            kwargs = {name: value for name, value in kwargs.items() if name in parameters}
+        return commons.task_summary(function)(**kwargs)
+    task.__name__ = task.__qualname__ = function_name
+    return task
+
+
+stage_workbook = deferred_task('stage_workbook')
+run_sql_file = deferred_task('run_sql_file')
+transform_table = deferred_task('transform_table')
+load_staged_table = deferred_task('load_staged_table')
+remove_run_folder = deferred_task('remove_run_folder')
+generate_barcodes = deferred_task('generate_barcodes')
+export_ml_dataset = deferred_task('export_ml_dataset')
+batch_data_transformation = deferred_task('batch_data_transformation')
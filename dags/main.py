@@ -1,7 +1,9 @@
 from airflow import DAG
-from airflow.operators.python_operator import PythonOperator
+from airflow.operators.python import PythonOperator
 from datetime import datetime
-from common.commons import data_transofmation,populate_barcode
+# the callables import commons when they run, parsing this file only imports airflow
+from common.tasks import (stage_workbook,run_sql_file,transform_table,load_staged_table,remove_run_folder,
+                          generate_barcodes,export_ml_dataset,batch_data_transformation)
 
 
 default_args = {
@@ -16,17 +18,112 @@ dag = DAG(
     schedule_interval=None,
 )
 
-send_excel_to_database = PythonOperator(
-    task_id='send_excel_to_database',
-    python_callable=data_transofmation,
-    op_kwargs={'data_path':'/opt/data/input.xlsx'},
+data_path = '/opt/data/input.xlsx'
+# intermediate tables of a run, shared by its transform and load tasks
+run_folder = '/opt/staging/runs/{{ run_id }}'
+# every task returns the wall time, rows, bytes written and memory of its stages, it is kept in XCom
+dimension_tables = ['membrane_dimension', 'images_dimension', 'camera_dimension', 'date_dimension']
+fact_table = 'membrane_image_camera'
+
+stage_excel = PythonOperator(
+    task_id='stage_excel_file',
+    python_callable=stage_workbook,
+    # the sheets are validated and their bad rows quarantined once, the transform tasks read the valid rows
+    op_kwargs={'data_path':data_path, 'validate':True},
+    dag=dag,
+)
+
+create_tables = PythonOperator(
+    task_id='create_tables',
+    python_callable=run_sql_file,
+    op_kwargs={'sql_file':'create_queries.sql'},
     dag=dag,
 )
 
-generate_barcode = PythonOperator(
-    task_id='generate_barcode_and_save',
-    python_callable=populate_barcode,
+transform_tasks = {}
+load_tasks = {}
+for table_name in dimension_tables + [fact_table]:
+    transform_tasks[table_name] = PythonOperator(
+        task_id=f'transform_{table_name}',
+        python_callable=transform_table,
+        op_kwargs={'table_name':table_name, 'data_path':data_path, 'run_folder':run_folder},
+        dag=dag,
+    )
+    load_tasks[table_name] = PythonOperator(
+        task_id=f'load_{table_name}',
+        python_callable=load_staged_table,
+        op_kwargs={'table_name':table_name, 'run_folder':run_folder},
+        dag=dag,
+    )
+    stage_excel >> transform_tasks[table_name] >> load_tasks[table_name]
+    create_tables >> load_tasks[table_name]
+
+# the fact table references every dimension
+for table_name in dimension_tables:
+    load_tasks[table_name] >> load_tasks[fact_table]
+
+generate_membrane_barcodes = PythonOperator(
+    task_id='generate_membrane_barcodes',
+    python_callable=generate_barcodes,
+    op_kwargs={'table_name':'membrane_dimension', 'column_name':'membrane_name', 'output_folder':'membrane_barcodes',
+               'pipelined':True},
+    dag=dag
+)
+
+generate_images_barcodes = PythonOperator(
+    task_id='generate_images_barcodes',
+    python_callable=generate_barcodes,
+    op_kwargs={'table_name':'images_dimension', 'column_name':'image_name', 'output_folder':'images_barcodes',
+               'pipelined':True},
     dag=dag
 )
 
-send_excel_to_database>> generate_barcode
+load_tasks['membrane_dimension'] >> generate_membrane_barcodes
+load_tasks['images_dimension'] >> generate_images_barcodes
+
+# usable images with their membrane, camera and lab counts, as parquet shards under /opt/results/ml_dataset
+export_ml_data = PythonOperator(
+    task_id='export_ml_dataset',
+    python_callable=export_ml_dataset,
+    op_kwargs={'output_folder':'ml_dataset'},
+    dag=dag
+)
+
+load_tasks[fact_table] >> export_ml_data
+
+# the intermediate tables are removed once the run succeeded, a failed run keeps them for its retries
+cleanup_run_folder = PythonOperator(
+    task_id='cleanup_run_folder',
+    python_callable=remove_run_folder,
+    op_kwargs={'run_folder':run_folder},
+    dag=dag
+)
+
+[load_tasks[fact_table], export_ml_data] >> cleanup_run_folder
+
+# ingests the workbooks dropped by the labs in the landing folder, every workbook once
+batch_dag = DAG(
+    'membrane_Image_database_batch',
+    default_args=default_args,
+    description='A DAG to ingest every new Excel file of the landing folder into PostgreSQL',
+    schedule_interval='@hourly',
+    catchup=False,
+    max_active_runs=1,
+)
+
+ingest_landing_workbooks = PythonOperator(
+    task_id='ingest_landing_workbooks',
+    python_callable=batch_data_transformation,
+    op_kwargs={'landing_folder':'/opt/data/landing', 'incremental':True},
+    dag=batch_dag,
+)
+
+for table_name, column_name, output_folder in [('membrane_dimension', 'membrane_name', 'membrane_barcodes'),
+                                               ('images_dimension', 'image_name', 'images_barcodes')]:
+    ingest_landing_workbooks >> PythonOperator(
+        task_id=f'generate_{output_folder}',
+        python_callable=generate_barcodes,
+        op_kwargs={'table_name':table_name, 'column_name':column_name, 'output_folder':output_folder,
+                   'pipelined':True},
+        dag=batch_dag,
+    )
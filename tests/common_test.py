@@ -1,24 +1,41 @@
 import unittest
+import json
+import openpyxl
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import sys
 import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import zipfile
+from unittest import mock
 
 
 current = os.path.dirname(os.path.realpath(__file__))
 parent = os.path.dirname(current)
 sys.path.append(parent)
 
-from dags.common.commons import (convert_int_to_percent, copy_columns, drop_columns, read_file, convert_to_date, 
+from dags.common.commons import (convert_int_to_percent, copy_columns, read_file,
                           replace_nan_with_column_value, 
                         update_and_rename_columns,
                         generate_membrane_column_from_image_name,
-                        date_data)
+                        build_membrane_automaton, match_longest_membrane,
+                        date_data, read_file_in_chunks, drop_seen_rows, compute_row_keys,
+                        generate_and_save_barcode, stage_workbook, prepare_membrane_data,
+                        prepare_images_data, schema_setup, complete_fact_table, transform_table,
+                        read_staged_sheet, instrument_stage, task_summary, write_parquet_shards,
+                        discover_new_workbooks, transform_workbook, merge_workbook_tables, validate_sheets,
+                        parse_booleans)
+from dags.common import commons, tasks
 
 
 class TestReadFile(unittest.TestCase):
 
     def test_read_file(self):
-        test_data_path = "E:\Yash-Spore.bio-test\data\input.xlsx"
+        test_data_path = os.path.join(parent, 'data', 'input.xlsx')
         membrane_df, images_df = read_file(test_data_path)
 
         self.assertIsNotNone(membrane_df)
@@ -28,6 +45,240 @@ class TestReadFile(unittest.TestCase):
         self.assertIsInstance(images_df, pd.DataFrame)
 
 
+    def test_read_file_in_chunks(self):
+        test_data_path = os.path.join(parent, 'data', 'input.xlsx')
+        chunks = list(read_file_in_chunks(test_data_path, 'Images', chunk_size=10))
+        _, images_df = read_file(test_data_path)
+
+        self.assertTrue(all(len(chunk) <= 10 for chunk in chunks))
+        streamed_df = pd.concat(chunks, ignore_index=True)
+        pd.testing.assert_frame_equal(streamed_df, images_df, check_dtype=False)
+
+    def test_stream_quarantine_keeps_sheet_rows(self):
+        with tempfile.TemporaryDirectory() as folder:
+            # the last membrane sits under a blank row, on row 5 of the sheet
+            workbook = openpyxl.Workbook()
+            sheet = workbook.active
+            sheet.title = 'Membranes'
+            for row in [['membrane name', 'Usable for ML'], ['MEM1', True], [None, True], [None, None],
+                        ['MEM1', 'maybe']]:
+                sheet.append(row)
+            workbook.save(os.path.join(folder, 'input.xlsx'))
+            writers = {}
+            for chunk in read_file_in_chunks(os.path.join(folder, 'input.xlsx'), 'Membranes', chunk_size=2):
+                _, quarantined = commons.validate_membrane_data(chunk, seen_names=set())
+                commons.append_quarantine(writers, 'Membranes', quarantined, folder)
+            commons.append_quarantine(writers, 'Membranes', pd.DataFrame({
+                'membrane name': [12], 'Usable for ML': [0.5], 'row_number': [9], 'quarantine_reason': ['test']}),
+                folder)
+            commons.close_quarantine(writers, ['Membranes', 'Images'], folder)
+            quarantined = read_staged_sheet(os.path.join(folder, 'Membranes.parquet'))
+            self.assertEqual(list(quarantined['row_number']), [3, 5, 9])
+            self.assertEqual(list(quarantined['membrane name'].iloc[1:]), ['MEM1', 12])
+            self.assertEqual(sorted(os.listdir(folder)), ['Membranes.parquet', 'input.xlsx'])
+
+
+    def test_read_file_from_staging(self):
+        test_data_path = os.path.join(parent, 'data', 'input.xlsx')
+        membrane_df, images_df = read_file(test_data_path)
+        with tempfile.TemporaryDirectory() as staging_folder:
+            staged_folder = stage_workbook(test_data_path, staging_folder)
+            self.assertTrue(os.path.exists(os.path.join(staged_folder, 'Images.parquet')))
+            staged_membrane_df, staged_images_df = read_file(test_data_path, staging_folder)
+
+        pd.testing.assert_frame_equal(staged_membrane_df, membrane_df)
+        pd.testing.assert_frame_equal(staged_images_df, images_df)
+        self.assertIn('FAUX', list(staged_images_df['Usable for ML']))
+
+
+    def test_transform_table(self):
+        test_data_path = os.path.join(parent, 'data', 'input.xlsx')
+        membrane_df, images_df = read_file(test_data_path)
+        membrane_df, images_df, fact_df, camera_df, date_df = schema_setup(prepare_membrane_data(membrane_df),
+                                                                           prepare_images_data(images_df))
+        fact_df = complete_fact_table(fact_df, membrane_df)
+        expected_tables = {'membrane_dimension': membrane_df, 'images_dimension': images_df,
+                           'camera_dimension': camera_df, 'date_dimension': date_df,
+                           'membrane_image_camera': fact_df}
+        with tempfile.TemporaryDirectory() as run_folder:
+            for table_name, expected_df in expected_tables.items():
+                transform_table(table_name, test_data_path, run_folder, staging_folder=None)
+                output = read_staged_sheet(os.path.join(run_folder, f'{table_name}.parquet'))
+                pd.testing.assert_frame_equal(output, expected_df.reset_index(drop=True), check_dtype=False)
+
+    def test_discover_new_workbooks(self):
+        test_data_path = os.path.join(parent, 'data', 'input.xlsx')
+        with tempfile.TemporaryDirectory() as landing_folder:
+            for file_name in ['a.xlsx', 'a_copy.xlsx']:
+                shutil.copy(test_data_path, os.path.join(landing_folder, file_name))
+            open(os.path.join(landing_folder, 'notes.txt'), 'w').close()
+            new_workbooks = discover_new_workbooks(landing_folder, {})
+            self.assertEqual(len(new_workbooks), 1)
+            manifest = {content_hash: {} for content_hash in new_workbooks.values()}
+            with mock.patch.object(commons, 'file_content_hash') as file_content_hash:
+                self.assertEqual(discover_new_workbooks(landing_folder, manifest), {})
+            file_content_hash.assert_not_called()
+        self.assertEqual(discover_new_workbooks(os.path.join(landing_folder, 'missing'), {}), {})
+
+    def test_merge_workbook_tables(self):
+        test_data_path = os.path.join(parent, 'data', 'input.xlsx')
+        tables = transform_workbook(test_data_path, staging_folder=None)
+        merged_tables = merge_workbook_tables([tables, transform_workbook(test_data_path, staging_folder=None)])
+        self.assertEqual([len(table) for table in merged_tables], [len(table) for table in tables])
+
+    def test_dimension_cache_round_trip(self):
+        keys = pd.Series([0, 20210101], index=pd.to_datetime([None, '2021-01-01']), name='date_id')
+        with tempfile.TemporaryDirectory() as cache_folder, \
+                mock.patch.object(commons, 'dimension_cache_path', cache_folder):
+            self.assertEqual(commons.read_dimension_cache('date_dimension'), (None, None))
+            commons.write_dimension_cache('date_dimension', [2, 20210101, 16384], keys)
+            version, output = commons.read_dimension_cache('date_dimension')
+        self.assertEqual(version, [2, 20210101, 16384])
+        pd.testing.assert_series_equal(output, keys, check_names=False, check_index_type=False)
+
+    def test_write_parquet_shards(self):
+        schema = pa.schema([('A', pa.int64()), ('B', pa.string())])
+        batches = [pa.RecordBatch.from_pydict({'A': list(range(start, start + 5)), 'B': ['x'] * 5}, schema=schema)
+                   for start in (0, 5)]
+        with tempfile.TemporaryDirectory() as folder:
+            open(os.path.join(folder, 'part-00009.parquet'), 'w').close()
+            shard_paths = write_parquet_shards(batches, folder, schema, shard_rows=4)
+            self.assertEqual(sorted(os.listdir(folder)), ['part-00000.parquet', 'part-00001.parquet', 'part-00002.parquet'])
+            self.assertEqual([pq.read_metadata(path).num_rows for path in shard_paths], [4, 4, 2])
+            self.assertEqual(pd.read_parquet(folder)['A'].tolist(), list(range(10)))
+
+    def test_task_summary_reports_stages(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.settimeout(5)
+        double_rows = instrument_stage('double_rows')(lambda dataframe: pd.concat([dataframe, dataframe]))
+        with mock.patch.object(commons, 'statsd_address', listener.getsockname()):
+            summary = task_summary(double_rows)(pd.DataFrame({'A': [1, 2, 3]}))
+        datagram = listener.recv(65535).decode()
+        listener.close()
+
+        self.assertEqual(summary['stages']['double_rows']['calls'], 1)
+        self.assertEqual(summary['stages']['double_rows']['rows_in'], 3)
+        self.assertEqual(summary['stages']['double_rows']['rows_out'], 6)
+        self.assertEqual(len(summary['result']), 6)
+        self.assertIn('spore.double_rows.rows_out:6|c', datagram.splitlines())
+
+    def test_deferred_task_drops_task_context(self):
+        with mock.patch.object(commons, 'transform_table', autospec=True, return_value=None) as transform:
+            summary = tasks.transform_table(table_name='camera_dimension', data_path='input.xlsx', run_folder='run',
+                                            ti=mock.Mock(), run_id='manual')
+        transform.assert_called_once_with(table_name='camera_dimension', data_path='input.xlsx', run_folder='run')
+        self.assertEqual(summary['task'], 'transform_table')
+
+    def test_tasks_import_is_light(self):
+        code = 'import sys, common.tasks; print(" ".join(sorted(sys.modules)))'
+        output = subprocess.run([sys.executable, '-c', code], cwd=os.path.join(parent, 'dags'), check=True,
+                                capture_output=True, text=True)
+        imported = {name.split('.')[0] for name in output.stdout.split()}
+        self.assertNotIn('common.commons', output.stdout.split())
+        self.assertFalse(imported & {'numpy', 'pandas', 'pyarrow', 'psycopg2', 'sqlalchemy', 'barcode', 'PIL'})
+
+    def test_validate_sheets(self):
+        test_data_path = os.path.join(parent, 'data', 'input.xlsx')
+        membrane_df, images_df = read_file(test_data_path)
+        images_df = images_df.astype({'filtration_date_yymmdd': object})
+        images_df.loc[0, 'filtration_date_yymmdd'] = '23x817'
+        images_df.loc[1, 'ecoli %'] = 5
+        images_df.loc[2, 'image name'] = 'UNKNOWN_01_O1'
+        images_df.loc[3, 'Usable for ML'] = 'VRAI'
+        with tempfile.TemporaryDirectory() as quarantine_folder:
+            valid_membrane_df, valid_images_df, _ = validate_sheets(membrane_df, images_df, quarantine_folder)
+            quarantined = read_staged_sheet(os.path.join(quarantine_folder, 'Images.parquet'))
+            self.assertFalse(os.path.exists(os.path.join(quarantine_folder, 'Membranes.parquet')))
+        self.assertEqual(len(valid_membrane_df), len(membrane_df))
+        self.assertEqual(len(valid_images_df), len(images_df) - 3)
+        self.assertEqual(list(quarantined['row_number']), [2, 3, 4])
+        self.assertEqual(list(quarantined['quarantine_reason']), [
+            'filtration date is not yymmdd', 'ecoli_percentage is not between 0 and 1',
+            'image name matches no membrane'])
+
+    def test_read_validated_workbook_validates_once(self):
+        test_data_path = os.path.join(parent, 'data', 'input.xlsx')
+        with tempfile.TemporaryDirectory() as staging_folder:
+            stage_workbook(test_data_path, staging_folder, validate=True)
+            with mock.patch.object(commons, 'validate_sheets') as validate:
+                membrane_df, images_df = commons.read_validated_workbook(test_data_path, staging_folder)
+        validate.assert_not_called()
+        self.assertEqual(len(membrane_df), len(read_file(test_data_path)[0]))
+
+    def test_write_staged_sheet_concurrent_writers(self):
+        dataframe = pd.DataFrame({'A': range(1000)})
+        with tempfile.TemporaryDirectory() as folder:
+            parquet_path = os.path.join(folder, 'Images.parquet')
+            with commons.ThreadPoolExecutor(5) as executor:
+                list(executor.map(lambda _: commons.write_staged_sheet(dataframe, parquet_path), range(5)))
+            self.assertEqual(os.listdir(folder), ['Images.parquet'])
+            # the mode of a file created with open, not the owner only mode of mkstemp
+            umask = os.umask(0)
+            os.umask(umask)
+            self.assertEqual(os.stat(parquet_path).st_mode & 0o777, 0o666 & ~umask)
+            pd.testing.assert_frame_equal(read_staged_sheet(parquet_path), dataframe)
+
+    def test_unchanged_upsert_skips_membrane_statistics(self):
+        fact_df = pd.DataFrame({'membrane': ['MEM1', 'MEM2'], 'image_name': ['MEM1_01_O1', 'MEM2_01_O1']})
+        with mock.patch.object(commons, 'resolve_fact_keys', side_effect=lambda dataframe, *_, **__: dataframe), \
+                mock.patch.object(commons, 'upsert_table') as upsert_table, \
+                mock.patch.object(commons, 'refresh_membrane_statistics') as refresh_membrane_statistics:
+            upsert_table.return_value = fact_df.iloc[:0]
+            commons.load_fact_rows(fact_df, mock.Mock(), 'upsert')
+            refresh_membrane_statistics.assert_not_called()
+            upsert_table.return_value = fact_df.iloc[1:]
+            commons.load_fact_rows(fact_df, mock.Mock(), 'upsert')
+        self.assertEqual(list(refresh_membrane_statistics.call_args.args[1]), ['MEM2'])
+
+    def test_refresh_membrane_statistics_query(self):
+        connection = mock.MagicMock()
+        cursor = connection.cursor.return_value.__enter__.return_value
+        commons.refresh_membrane_statistics(connection)
+        query, parameters = cursor.execute.call_args.args
+        self.assertIn('DELETE FROM spore.membrane_statistics WHERE TRUE;', query)
+        self.assertIn('WHERE TRUE AND f.membrane IS NOT NULL', query)
+        self.assertEqual(parameters, [])
+        commons.refresh_membrane_statistics(connection, ['MEM1'])
+        query, parameters = cursor.execute.call_args.args
+        self.assertIn('WHERE f.membrane = ANY(%s) AND f.membrane IS NOT NULL', query)
+        self.assertEqual(parameters, [['MEM1'], ['MEM1']])
+
+    def test_parse_booleans(self):
+        output = parse_booleans(pd.Series([True, 'FAUX', 'Vrai', 0.0, None, 'maybe'], dtype=object))
+        self.assertEqual(list(output), [True, False, True, False, None, None])
+
+    def test_insert_to_database_resumes_from_checkpoints(self):
+        tables = {name: pd.DataFrame({'name': [name]}) for name in ['membrane', 'images', 'camera', 'fact', 'date']}
+        with mock.patch.object(commons, 'run_sql_file'), \
+                mock.patch.object(commons, 'load_checkpoints', return_value={'membrane_dimension', 'camera_dimension'}), \
+                mock.patch.object(commons, 'clear_load_checkpoints') as clear_load_checkpoints, \
+                mock.patch.object(commons, 'load_table') as load_table:
+            commons.insert_to_database(*tables.values(), load_workers=1, load_id='workbook:1')
+        self.assertEqual([call.args[1] for call in load_table.call_args_list],
+                         ['images_dimension', 'date_dimension', 'membrane_image_camera'])
+        self.assertTrue(all(call.kwargs['load_id'] == 'workbook:1' for call in load_table.call_args_list))
+        clear_load_checkpoints.assert_called_once_with('workbook:1')
+
+    def test_drop_seen_rows(self):
+        seen_rows = set()
+        first_chunk = pd.DataFrame({'A': ['x', 'y'], 'B': [1, None]})
+        second_chunk = pd.DataFrame({'A': ['y', 'z'], 'B': [None, 2]})
+        self.assertEqual(len(drop_seen_rows(first_chunk, seen_rows, ['A', 'B'])), 2)
+        self.assertEqual(list(drop_seen_rows(second_chunk, seen_rows, ['A', 'B'])['A']), ['z'])
+
+
+    def test_compute_row_keys(self):
+        full_read = pd.DataFrame({'name': ['a', 'b'], 'count': [1.0, None], 'flag': [True, 'FAUX']})
+        chunk_read = pd.DataFrame({'name': ['a'], 'count': [1], 'flag': [1.0]})
+        changed = pd.DataFrame({'name': ['a'], 'count': [2], 'flag': [True]})
+        columns = ['name', 'count', 'flag']
+
+        self.assertEqual(compute_row_keys(full_read, columns)[0], compute_row_keys(chunk_read, columns)[0])
+        self.assertNotEqual(compute_row_keys(full_read, columns)[0], compute_row_keys(changed, columns)[0])
+        self.assertEqual(compute_row_keys(full_read, ['name'])[0], compute_row_keys(changed, ['name'])[0])
+
+
     def test_replace_nan_with_column_value(self):
         data = {'A': [1, 2, None, 4],
                 'B': [10, None, 30, None]}
@@ -51,6 +302,7 @@ class TestReadFile(unittest.TestCase):
         self.assertIn('new_col2', updated_df.columns)
         self.assertNotIn('col1', updated_df.columns)
         self.assertNotIn('col2', updated_df.columns)
+        self.assertEqual(specific_columns, {'col2': 'new_col2', 'col3': 'new_col3'})
     
 
     def test_generate_membrane_column_from_image_name(self):
@@ -67,15 +319,33 @@ class TestReadFile(unittest.TestCase):
         })
         pd.testing.assert_frame_equal(result, expected_result)
 
+    def test_generate_membrane_column_longest_match(self):
+        membrane_data = pd.DataFrame({
+            'membrane_name': ["MEM1", "MEM1-R2", "R2_0", "XYZ"]
+        })
+        images_data = pd.DataFrame({
+            'image_name': ["MEM1-R2_01", "MEM1_01", "MEM1-R2_0X", "NOTHING"]
+        })
+        result = generate_membrane_column_from_image_name(membrane_data, images_data)
+        self.assertEqual(list(result['membrane']), ["MEM1-R2", "MEM1", "MEM1-R2", ""])
+
+    def test_match_longest_membrane_tie_break(self):
+        automaton = build_membrane_automaton(["BBB", "AAA", "AA"])
+        self.assertEqual(match_longest_membrane(automaton, "AAA_BBB"), "BBB")
+        self.assertEqual(match_longest_membrane(automaton, "xAAx"), "AA")
+        self.assertEqual(match_longest_membrane(automaton, ""), "")
+
     def test_date_data(self):
         membrane_images = pd.DataFrame({
             'filtration_date': ['210101', '210102', '210103']
         })
         expected_output = pd.DataFrame({
+            'date_id': [20210101, 20210102, 20210103],
             'filtration_date': pd.to_datetime(['210101', '210102', '210103'], format='%y%m%d'),
-            'date_day': [1, 2, 3],
-            'date_month': [1, 1, 1],
-            'date_year': [2021, 2021, 2021]
+            # the .dt accessors give int32 columns
+            'date_day': pd.Series([1, 2, 3], dtype='int32'),
+            'date_month': pd.Series([1, 1, 1], dtype='int32'),
+            'date_year': pd.Series([2021, 2021, 2021], dtype='int32')
         })
         output = date_data(membrane_images)
         pd.testing.assert_frame_equal(output, expected_output)
@@ -109,5 +379,74 @@ class TestReadFile(unittest.TestCase):
         output = convert_int_to_percent(dataframe, columns_to_clean)
         pd.testing.assert_frame_equal(output, expected_output)
 
+
+    def test_generate_and_save_barcode_skips_cached(self):
+        with tempfile.TemporaryDirectory() as results_folder:
+            os.makedirs(os.path.join(results_folder, 'membrane_barcodes'))
+            barcode_path = os.path.join(results_folder, 'membrane_barcodes', 'barcode_MEM1.png')
+            generate_and_save_barcode(['MEM1', 'MEM2'], 'membrane_barcodes', workers=1, results_folder=results_folder)
+            self.assertTrue(os.path.exists(barcode_path))
+
+            os.utime(barcode_path, (0, 0))
+            generate_and_save_barcode(['MEM1', 'MEM2'], 'membrane_barcodes', workers=1, results_folder=results_folder)
+            self.assertEqual(os.path.getmtime(barcode_path), 0)
+
+    def test_pipeline_barcodes(self):
+        with tempfile.TemporaryDirectory() as results_folder:
+            # two fetchers splitting the membranes between them, as fetch_sources gives with fetch_workers=2
+            sources = [(iter(['MEM2']), os.path.join(results_folder, 'membrane_barcodes')),
+                       (iter(['MEM1']), os.path.join(results_folder, 'membrane_barcodes')),
+                       (iter(['MEM1_01_O1']), os.path.join(results_folder, 'images_barcodes'))]
+            options = dict(commons.barcode_pipeline_options, render_workers=1, fetch_queue_size=1, write_queue_size=1)
+            commons.pipeline_barcodes(sources, batch_size=1, options=options)
+            self.assertEqual(sorted(os.listdir(os.path.join(results_folder, 'membrane_barcodes'))),
+                             ['.barcode_cache.json', 'barcode_MEM1.png', 'barcode_MEM2.png'])
+            with open(os.path.join(results_folder, 'membrane_barcodes', '.barcode_cache.json')) as file:
+                self.assertEqual(list(json.load(file)), ['barcode_MEM1.png', 'barcode_MEM2.png'])
+            self.assertTrue(os.path.exists(os.path.join(results_folder, 'images_barcodes', 'barcode_MEM1_01_O1.png')))
+
+    def test_prefetch_raises_producer_error(self):
+        def failing():
+            yield 1
+            raise ValueError('fetch failed')
+        with self.assertRaises(ValueError):
+            list(commons.prefetch([failing(), iter([2, 3])], queue_size=1))
+
+    def test_prefetch_closes_stopped_producers(self):
+        closed = []
+        def codes(name):
+            try:
+                yield from range(100)
+            finally:
+                closed.append(name)
+        batches = commons.prefetch([codes('first'), codes('second')], queue_size=1)
+        next(batches)
+        batches.close()
+        self.assertEqual(sorted(closed), ['first', 'second'])
+
+    def test_write_barcode_pngs_keys_rendered_options(self):
+        writer_options = dict(commons.barcode_writer_options, module_height=5)
+        with tempfile.TemporaryDirectory() as folder:
+            written, bytes_written = commons.write_barcode_pngs([('MEM1', 'barcode_MEM1.png', b'png')], folder,
+                                                                writer_options)
+        self.assertEqual(written, {'barcode_MEM1.png': commons.barcode_cache_key('MEM1', writer_options)})
+        self.assertEqual(bytes_written, 3)
+
+    def test_generate_and_save_barcode_sheets_and_archive(self):
+        codes = [f'MEM{number}' for number in range(20)]
+        with tempfile.TemporaryDirectory() as results_folder:
+            generate_and_save_barcode(codes, 'sheets', workers=1, results_folder=results_folder, output_format='pdf')
+            index = pd.read_csv(os.path.join(results_folder, 'sheets', 'index.csv'))
+            self.assertEqual(sorted(index['code']), sorted(codes))
+            self.assertEqual(index['page'].max(), 2)
+            self.assertTrue(os.path.exists(os.path.join(results_folder, 'sheets', 'labels_00000.pdf')))
+
+            generate_and_save_barcode(codes, 'archive', workers=1, batch_size=7, results_folder=results_folder,
+                                      output_format='zip')
+            with zipfile.ZipFile(os.path.join(results_folder, 'archive', 'barcodes.zip')) as archive:
+                self.assertEqual(len(archive.namelist()), len(codes) + 1)
+                index = pd.read_csv(archive.open('index.csv'))
+            self.assertEqual(index['code'].tolist(), codes)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,4 +1,6 @@
 from airflow.models import DagBag
+import subprocess
+import sys
 import unittest
 
 
@@ -8,16 +10,56 @@ def test_dag_structure():
     """
     dag_id = 'membrane_Image_database'
     dags = DagBag('./dags/main.py').get_dag(dag_id)
+    tables = ['membrane_dimension', 'images_dimension', 'camera_dimension', 'date_dimension', 'membrane_image_camera']
 
     # Confirm the DAG and task ID exists
     assert dags is not None
     assert dag_id == dags.dag_id
-    assert dags.has_task('send_excel_to_database')
-    assert dags.has_task('generate_barcode_and_save')
+    assert dags.has_task('stage_excel_file')
+    assert dags.has_task('create_tables')
+    for table in tables:
+        assert dags.has_task(f'transform_{table}')
+        assert dags.has_task(f'load_{table}')
+    assert dags.has_task('generate_membrane_barcodes')
+    assert dags.has_task('generate_images_barcodes')
+    assert dags.has_task('export_ml_dataset')
+    assert dags.has_task('cleanup_run_folder')
 
     # Confirm the tasks are in the correct order
-    assert dags.get_task('send_excel_to_database').downstream_task_ids == {'generate_barcode_and_save'}
-    assert dags.get_task('generate_barcode_and_save').upstream_task_ids == {'send_excel_to_database'}
+    assert dags.get_task('stage_excel_file').downstream_task_ids == {f'transform_{table}' for table in tables}
+    for table in tables:
+        assert dags.get_task(f'transform_{table}').downstream_task_ids == {f'load_{table}'}
+    assert dags.get_task('load_membrane_image_camera').upstream_task_ids == {
+        'create_tables', 'transform_membrane_image_camera',
+        'load_membrane_dimension', 'load_images_dimension', 'load_camera_dimension', 'load_date_dimension'}
+    assert dags.get_task('generate_membrane_barcodes').upstream_task_ids == {'load_membrane_dimension'}
+    assert dags.get_task('generate_images_barcodes').upstream_task_ids == {'load_images_dimension'}
+    assert dags.get_task('export_ml_dataset').upstream_task_ids == {'load_membrane_image_camera'}
+    assert dags.get_task('cleanup_run_folder').upstream_task_ids == {'load_membrane_image_camera', 'export_ml_dataset'}
+
+
+def test_batch_dag_structure():
+    """
+    Test whether the batch DAG has the expected structure.
+    """
+    dags = DagBag('./dags/main.py').get_dag('membrane_Image_database_batch')
+
+    assert dags is not None
+    assert dags.get_task('ingest_landing_workbooks').downstream_task_ids == {
+        'generate_membrane_barcodes', 'generate_images_barcodes'}
+
+
+def test_dag_import_is_light():
+    """
+    Test whether parsing the DAG file imports none of the libraries of the tasks.
+    """
+    code = ('import sys, airflow, airflow.operators.python; before = set(sys.modules); import main; '
+            'print(" ".join(sorted(set(sys.modules) - before)))')
+    output = subprocess.run([sys.executable, '-c', code], cwd='./dags', check=True, capture_output=True, text=True)
+    imported = {name.split('.')[0] for name in output.stdout.split()}
+
+    assert 'common.commons' not in output.stdout.split()
+    assert not imported & {'numpy', 'pandas', 'pyarrow', 'psycopg2', 'barcode', 'PIL'}
 
 if __name__ == '__main__':
     unittest.main()